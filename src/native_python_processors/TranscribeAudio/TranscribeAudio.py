@@ -1,13 +1,10 @@
-import os
-import tempfile
-import shutil
+import threading
+from collections import OrderedDict
 from nifiapi.flowfiletransform import FlowFileTransform, FlowFileTransformResult
 from nifiapi.properties import PropertyDescriptor, StandardValidators, ExpressionLanguageScope
 
-try:
-    from openai import OpenAI
-except ImportError:
-    OpenAI = None
+# Maximum number of OpenAI clients (one per API key) kept alive per processor instance
+CLIENT_CACHE_SIZE = 4
 
 class TranscribeAudio(FlowFileTransform):
     class Java:
@@ -22,7 +19,8 @@ class TranscribeAudio(FlowFileTransform):
         tags = ['audio', 'transcription', 'openai', 'whisper', 'python']
 
     def __init__(self, **kwargs):
-        pass
+        self._client_cache = OrderedDict()
+        self._client_cache_lock = threading.Lock()
 
     OPENAI_API_KEY = PropertyDescriptor(
         name="OpenAI API Key",
@@ -51,46 +49,73 @@ class TranscribeAudio(FlowFileTransform):
     def getPropertyDescriptors(self):
         return [self.OPENAI_API_KEY, self.LANGUAGE, self.PROMPT]
 
-    def transform(self, context, flowFile):
-        if OpenAI is None:
-            self.logger.error("openai library not found.")
-            return FlowFileTransformResult(relationship="failure")
+    def _get_client(self, api_key):
+        """Returns a cached OpenAI client for the API key, so connections are reused across FlowFiles."""
+        with self._client_cache_lock:
+            client = self._client_cache.get(api_key)
+            if client is not None:
+                self._client_cache.move_to_end(api_key)
+                return client
+
+            # Imported on first use so NiFi can load the processor without paying for the SDK import
+            import httpx
+            from openai import OpenAI, DefaultHttpxClient
+
+            client = OpenAI(
+                api_key=api_key,
+                http_client=DefaultHttpxClient(limits=httpx.Limits(max_keepalive_connections=16))
+            )
+            self._client_cache[api_key] = client
+            evicted_client = None
+            if len(self._client_cache) > CLIENT_CACHE_SIZE:
+                _, evicted_client = self._client_cache.popitem(last=False)
+
+        if evicted_client is not None:
+            # Closed outside the lock, so other tasks do not wait for its connections to shut down
+            evicted_client.close()
+        return client
+
+    def onStopped(self, context):
+        with self._client_cache_lock:
+            clients = list(self._client_cache.values())
+            self._client_cache.clear()
+        for client in clients:
+            client.close()
 
+    def transform(self, context, flowFile):
         api_key = context.getProperty(self.OPENAI_API_KEY).evaluateAttributeExpressions().getValue()
         language = context.getProperty(self.LANGUAGE).evaluateAttributeExpressions(flowFile).getValue()
         prompt = context.getProperty(self.PROMPT).evaluateAttributeExpressions(flowFile).getValue()
 
-        client = OpenAI(api_key=api_key)
-        temp_dir = tempfile.mkdtemp()
-        
-        # We need to preserve extension if possible or default to mp3
+        try:
+            client = self._get_client(api_key)
+        except ImportError:
+            self.logger.error("openai library not found.")
+            return FlowFileTransformResult(relationship="failure")
+
+        # We need to preserve extension if possible or default to mp3, Whisper detects the format from it
         # NiFi doesn't always give us filename with extension in flowfile object directly in this context easily
         # unless we read attributes.
         filename = flowFile.getAttribute("filename")
         if not filename:
             filename = "audio.mp3"
-            
-        input_path = os.path.join(temp_dir, filename)
 
         try:
-            with open(input_path, 'wb') as f:
-                f.write(flowFile.getContentsAsBytes())
-
             self.logger.info(f"Transcribing {filename}...")
 
-            with open(input_path, "rb") as audio_file:
-                # Prepare args
-                args = {
-                    "model": "whisper-1",
-                    "file": audio_file,
-                    "response_format": "text"
-                }
-                if language:
-                    args["language"] = language
-                if prompt:
-                    args["prompt"] = prompt
+            # The FlowFileTransform API only exposes the content as bytes, so hand them to the client
+            # directly instead of copying them to a temporary file first
+            args = {
+                "model": "whisper-1",
+                "file": (filename, flowFile.getContentsAsBytes()),
+                "response_format": "text"
+            }
+            if language:
+                args["language"] = language
+            if prompt:
+                args["prompt"] = prompt
 
-                transcription = client.audio.transcriptions.create(**args)
+            transcription = client.audio.transcriptions.create(**args)
 
             return FlowFileTransformResult(
                 relationship="success",
@@ -101,5 +126,3 @@ class TranscribeAudio(FlowFileTransform):
         except Exception as e:
             self.logger.error(f"Transcription failed: {str(e)}")
             return FlowFileTransformResult(relationship="failure")
-        finally:
-            shutil.rmtree(temp_dir)
@@ -2,18 +2,30 @@ import sys
 from abc import ABC, abstractmethod
 import argparse
 import csv
+import itertools
 import json
 import os
+import re
+import uuid
+from functools import lru_cache
 from io import StringIO
 
-TRUTH_VALUE_LIST = {
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+TRUTH_VALUE_LIST = frozenset({
     "y",
     "yes",
     "true",
     "1",
     "1.0",
     "wahr",
-}
+})
+
+# Buffer size used for reading and writing data files
+FILE_BUFFER_SIZE = 1 << 20
 
 
 def is_true(value):
@@ -24,19 +36,164 @@ def is_true(value):
     :return: True, if the value is a truth value
     :rtype: bool
     """
-    return str(value).strip().lower() in TRUTH_VALUE_LIST
+    if value is True:
+        return True
+    if value is False or value is None:
+        return False
+    if isinstance(value, (int, float)):
+        return value == 1
+    if not isinstance(value, str):
+        value = str(value)
+    return value.strip().lower() in TRUTH_VALUE_LIST
 
 
 def ensure_directory(local_path):
-    if not os.path.exists(local_path):
+    # An empty path stands for the working directory
+    os.makedirs(local_path or ".", exist_ok=True)
+
+
+# Digit runs that may form an integer beyond 64 bit, which orjson parses as a float instead of failing
+_LONG_DIGITS_RE = re.compile(rb"\d{19,}")
+INT64_MAX = (1 << 63) - 1
+
+
+def has_oversized_integer(data):
+    """
+    Checks whether a JSON document may contain an integer beyond 64 bit.
+    Digit runs in strings or fractions are checked as well, a false positive only costs the faster parser.
+    :param data: JSON document
+    :type data: bytes
+    :rtype: bool
+    """
+    for match in _LONG_DIGITS_RE.finditer(data):
+        digits = match.group()
+        # Longer runs are beyond 64 bit anyway, and int() refuses very long ones
+        if len(digits) > 19 or int(digits) > INT64_MAX:
+            return True
+    return False
+
+
+def json_loads(data):
+    """
+    Parses a JSON document, using orjson if it is available
+    :param data: JSON document
+    :type data: bytes
+    :return: Parsed JSON data and whether the json module had to parse it
+    :rtype: tuple
+    """
+    if orjson is not None and not has_oversized_integer(data):
         try:
-            os.makedirs(local_path)
+            return orjson.loads(data), False
+        except orjson.JSONDecodeError:
+            # e.g. NaN or Infinity literals, which only the json module accepts
+            pass
+    return json.loads(data), True
+
+
+def json_dumps(data, use_json_module=False):
+    """
+    Serializes data to a JSON document, using orjson if it is available
+    :param data: Data to serialize
+    :param use_json_module: Serialize with the json module, e.g. for data json_loads had to parse with it
+    :type use_json_module: bool
+    :return: JSON document
+    :rtype: bytes
+    """
+    if orjson is not None and not use_json_module:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bit in entries passed to merge_data as dicts, which only the json module accepts
+            pass
+    # Same compact UTF-8 format as orjson, so the output does not depend on which serializer got used
+    document = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    try:
+        return document.encode("utf-8")
+    except UnicodeEncodeError:
+        # Lone surrogates cannot be encoded as UTF-8, so they are written as escapes
+        return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def advise_sequential(file_object):
+    """
+    Hints the operating system that a file will be read sequentially, so it reads ahead more aggressively
+    :param file_object: Opened file object
+    :type file_object: IO
+    """
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(file_object.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
         except OSError:
-            # Folder already got created by another thread
+            # The hint is optional, e.g. not supported for pipes
             pass
 
 
+def complete_ragged_entry(entry, header, row):
+    """
+    Completes the entry of a CSV row whose field count differs from the header, the way csv.DictReader does:
+    surplus values are kept as a list under the key "None" and missing values become "None"
+    :param entry: Entry built from the header and the row
+    :type entry: dict
+    :param header: Stripped header
+    :type header: list
+    :param row: Unstripped row values
+    :type row: list
+    """
+    if len(row) > len(header):
+        entry["None"] = str(row[len(header):]).strip()
+    else:
+        for key in header[len(row):]:
+            entry[key] = "None"
+
+
+def parse_list_index(key):
+    try:
+        return int(key)
+    except ValueError:
+        # Not a list index, e.g. "--1" or "²" that str.isdigit accepts
+        return None
+
+
+@lru_cache(maxsize=128)
+def compile_json_path(json_path):
+    """
+    Splits a dot separated JSON path into its keys, each paired with its list index, if the key is numeric
+    :param json_path: Dot separated JSON path
+    :type json_path: str
+    :return: Tuple of (key, index) pairs, the index being None for non numeric keys
+    :rtype: tuple
+    """
+    if json_path is None:
+        return ()
+    return tuple((key, parse_list_index(key)) for key in json_path.split("."))
+
+
+def merge_by_key(internal_dict, other_dict, manage_new):
+    """
+    Merges entries indexed by their entry key into another such index
+    :param internal_dict: Index to merge into
+    :type internal_dict: dict
+    :param other_dict: Index to merge from
+    :type other_dict: dict
+    :param manage_new: Callback receiving the key and entry of every entry added to internal_dict
+    :type manage_new: Callable
+    """
+    for other_key, other_entry in other_dict.items():
+        existing_entry = internal_dict.get(other_key)
+        if existing_entry is other_entry:
+            # Same entry object, e.g. when merging a data set into itself
+            continue
+        if existing_entry is not None:
+            existing_entry.update(other_entry)
+        else:
+            internal_dict[other_key] = other_entry
+            manage_new(other_key, other_entry)
+
+
 class MergeableData(ABC):
+    # Whether internal_dict is keyed by the id_key values of its entries
+    keyed_by_id = True
+
     def __init__(self, file_path, id_key):
         self.id_key = id_key
         self.load_file(file_path)
@@ -65,6 +222,11 @@ class MergeableData(ABC):
         :type update_dict: Union[Dict, MergeableData]
         """
         if isinstance(update_dict, MergeableData):
+            if self.keyed_by_id and update_dict.keyed_by_id:
+                # The update data is already indexed by its entry key, so reuse that key instead of looking it up again
+                merge_by_key(self.internal_dict, update_dict.internal_dict, self.manage_new)
+                return
+            # e.g. JSON objects, which are keyed by their object keys instead of the entry ids
             for other_dict in update_dict.internal_dict.values():
                 other_key = other_dict.get(self.id_key, None)
                 if other_key in self.internal_dict:
@@ -95,19 +257,24 @@ class MergeableCSVData(MergeableData):
 
     def __init__(self, file_path, id_key, **csv_args):
         self.data = {}
+        # Sorted field names of all entries, or None if they have to be inferred from the entries
+        self._field_names = None
         self.csv_args = csv_args
+        # The arguments do not change after construction, so they are only validated once
+        self.newline = csv_args.get("newline", None)
+        self.encoding = csv_args.get("encoding", None)
+        self._csv_args = self.clean_csv_args(csv_args)
         super().__init__(file_path, id_key)
 
-    @property
-    def newline(self):
-        return self.csv_args["newline"] if "newline" in self.csv_args else None
-
-    @property
-    def encoding(self):
-        return self.csv_args["encoding"] if "encoding" in self.csv_args else None
-
-    @property
-    def _csv_args(self):
+    @staticmethod
+    def clean_csv_args(csv_args):
+        """
+        Filters and converts user provided CSV arguments to csv module reader and writer arguments
+        :param csv_args: CSV arguments
+        :type csv_args: dict
+        :return: csv module arguments
+        :rtype: dict
+        """
         allowed_keys = {
             "dialect",
             "delimiter",
@@ -120,7 +287,7 @@ class MergeableCSVData(MergeableData):
         }
         clean_dict = {
             str(key).lower(): value
-            for key, value in self.csv_args.items()
+            for key, value in csv_args.items()
             if str(key).lower() in allowed_keys
         }
         quoting_options = {
@@ -152,27 +319,66 @@ class MergeableCSVData(MergeableData):
             ).lower().replace("cr", "\r").replace("lf", "\n")
         return clean_dict
 
+    def merge_data(self, update_dict):
+        super().merge_data(update_dict)
+        if self._field_names is None:
+            return
+        if isinstance(update_dict, MergeableCSVData) and update_dict._field_names is not None:
+            update_field_names = update_dict._field_names
+        elif isinstance(update_dict, dict):
+            update_field_names = update_dict.keys()
+        else:
+            # Other data may use different keys per entry, let save_file infer them
+            self._field_names = None
+            return
+        if not set(update_field_names).issubset(self._field_names):
+            self._field_names = tuple(sorted(set(self._field_names).union(update_field_names)))
+
     def infer_field_names(self):
+        if self._field_names is not None:
+            return self._field_names
         key_set = set()
         for entry in self.data.values():
             key_set.update(entry.keys())
         return sorted(list(key_set))
 
     def save_file(self, file_path):
-        field_names = self.infer_field_names()
+        field_names = tuple(self.infer_field_names())
         ensure_directory(os.path.dirname(file_path))
-        with open(file_path, "w", newline=self.newline, encoding=self.encoding) as csv_file:
-            writer = csv.DictWriter(csv_file, fieldnames=field_names, **self._csv_args)
-            writer.writeheader()
-            writer.writerows(self.data.values())
+        with open(file_path, "w", newline=self.newline, encoding=self.encoding,
+                  buffering=FILE_BUFFER_SIZE) as csv_file:
+            writer = csv.writer(csv_file, **self._csv_args)
+            writer.writerow(field_names)
+            writer.writerows([row.get(field, "") for field in field_names] for row in self.data.values())
 
     def load_file(self, file_path):
-        with open(file_path, "r", newline=self.newline, encoding=self.encoding) as csv_file:
-            reader = csv.DictReader(csv_file, **self._csv_args)
+        with open(file_path, "r", newline=self.newline, encoding=self.encoding, buffering=FILE_BUFFER_SIZE) as csv_file:
+            advise_sequential(csv_file)
+            reader = csv.reader(csv_file, **self._csv_args)
+            # All rows share the header, so its names only have to be stripped once
+            header = [key.strip() for key in next(reader, [])]
+            self._field_names = tuple(sorted(set(header)))
+            # Repeated values (e.g. codes or categories) share one string object instead of one copy per row
+            dedupe = {}.setdefault
+            data = self.data
+            id_key = self.id_key
+            header_length = len(header)
             for row in reader:
-                self.data[row.get(self.id_key, None)] = {
-                    str(key).strip(): str(value).strip() for key, value in row.items()
-                }
+                if not row:
+                    continue
+                entry = dict(zip(header, [dedupe(value, value) for value in map(str.strip, row)]))
+                # Read before completing the entry, so a missing id stays None like with csv.DictReader
+                entry_key = entry.get(id_key, None)
+                if len(row) != header_length:
+                    complete_ragged_entry(entry, header, row)
+                    self._field_names = None
+                    if entry_key is None and id_key in entry:
+                        # The entry's id became "None", while it is indexed under None
+                        self.keyed_by_id = False
+                data[entry_key] = entry
+            if not data:
+                # Like inferring them from the entries, a file without rows has no field names
+                self._field_names = ()
 
     @property
     def internal_dict(self):
@@ -189,59 +395,152 @@ class MergeableJSONData(MergeableData):
 
     def __init__(self, file_path, id_key, json_path=None):
         self.json_path = json_path
+        self._json_path_parts = compile_json_path(json_path)
         self.json_base = None
         self.json_data = None
         self.data_list = None
+        # Entries added by merges, appended to data_list at once when saving
+        self.new_entries = []
+        # orjson writes NaN and Infinity as null, so data containing them is written by the json module as well
+        self.use_json_module = False
         super().__init__(file_path, id_key)
 
     def load_file(self, file_path):
-        self.json_base = json.load(open(file_path, "rb"))
+        with open(file_path, "rb", buffering=FILE_BUFFER_SIZE) as json_file:
+            advise_sequential(json_file)
+            self.json_base, self.use_json_module = json_loads(json_file.read())
         entry_structure = self.json_base
-        if self.json_path is not None:
-            keys = self.json_path.split(".")
-            for key in keys:
-                if isinstance(entry_structure, dict):
-                    entry_structure = entry_structure.get(key, {})
-                elif isinstance(entry_structure, list):
-                    try:
-                        key = int(key)
-                    except ValueError:
-                        raise ParserError(f"path {self.json_path} does not fit the delivered structure")
-                    if len(list) > key:
-                        entry_structure = entry_structure[key]
-                    else:
-                        raise ParserError(f"Index error: the delivered structure does not contain an index {key}")
+        for key, index in self._json_path_parts:
+            if isinstance(entry_structure, dict):
+                entry_structure = entry_structure.get(key, {})
+            elif isinstance(entry_structure, list):
+                if index is None:
+                    raise ParserError(f"path {self.json_path} does not fit the delivered structure")
+                if -len(entry_structure) <= index < len(entry_structure):
+                    entry_structure = entry_structure[index]
+                else:
+                    raise ParserError(f"Index error: the delivered structure does not contain an index {index}")
         if isinstance(entry_structure, list):
-            self.json_data = {}
+            id_key = self.id_key
+            self.json_data = {entry.get(id_key, None): entry for entry in entry_structure}
             self.data_list = entry_structure
-            for entry in entry_structure:
-                self.json_data[entry.get(self.id_key, None)] = entry
         elif isinstance(entry_structure, dict):
             self.json_data = entry_structure
+            self.keyed_by_id = False
         else:
             raise ParserError(
                 f"Could not parse the JSON file {file_path} - it neither contains a list, nor a JSON object."
             )
 
     def manage_new(self, key, entry):
-        if self.data_list:
-            self.data_list.append(entry)
+        if self.data_list is not None:
+            self.new_entries.append(entry)
+
+    def merge_data(self, update_dict):
+        if isinstance(update_dict, MergeableJSONData) and update_dict.use_json_module:
+            self.use_json_module = True
+        super().merge_data(update_dict)
 
     @property
     def internal_dict(self):
         return self.json_data
 
     def save_file(self, file_path):
+        if self.new_entries:
+            self.data_list.extend(self.new_entries)
+            self.new_entries = []
         ensure_directory(os.path.dirname(file_path))
-        json.dump(self.json_base, open(file_path, "w"))
+        with open(file_path, "wb", buffering=FILE_BUFFER_SIZE) as json_file:
+            json_file.write(json_dumps(self.json_base, self.use_json_module))
 
 
-def parse_csv_args(csv_args):
+@lru_cache(maxsize=128)
+def _parse_csv_args(csv_args):
     parsed_list = list(csv.reader(StringIO(csv_args), delimiter=",", quoting=csv.QUOTE_MINIMAL))
     if len(parsed_list) > 0:
-        split_args = [e.split("=", 1) for e in parsed_list[0] if e and "=" in e]
-        return {arg: value for arg, value in split_args}
-    return {}
+        return tuple(tuple(e.split("=", 1)) for e in parsed_list[0] if e and "=" in e)
+    return ()
+
+
+def parse_csv_args(csv_args):
+    # The parsed pairs are cached, as the processor usually passes the same argument string for every flow file
+    return dict(_parse_csv_args(csv_args))
+
+
+def merge_csv_files_streaming(id_key, input_path, patch_path, output_path, input_csv_args, patch_csv_args):
+    """
+    Merges two CSV files while streaming the input file, so only the patch data is held in memory.
+    The result matches the dict based merge: patch values win, input order is kept, new rows are appended
+    and the columns are written in sorted order.
+    Input files with duplicate entry keys are left to the dict based merge, which collapses them into one row.
+    The rows are written to a temporary file next to the output, which only replaces the output on success.
+    :return: True, if the files got merged. False, if the dict based merge has to be used instead
+    :rtype: bool
+    """
+    patch_handler = MergeableCSVData(patch_path, id_key, **patch_csv_args)
+    if not patch_handler.keyed_by_id:
+        # The dict based merge looks up the ids of such patch entries instead of their keys
+        return False
+    newline = input_csv_args.get("newline", None)
+    encoding = input_csv_args.get("encoding", None)
+
+    output_directory = os.path.dirname(output_path)
+    ensure_directory(output_directory)
+    temp_path = os.path.join(output_directory, f".{os.path.basename(output_path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(input_path, "r", newline=newline, encoding=encoding, buffering=FILE_BUFFER_SIZE) as input_file, \
+                open(temp_path, "x", newline=newline, encoding=encoding, buffering=FILE_BUFFER_SIZE) as output_file:
+            merged = _stream_csv_merge(
+                id_key,
+                input_file,
+                output_file,
+                patch_handler,
+                MergeableCSVData.clean_csv_args(input_csv_args),
+            )
+        if merged:
+            os.replace(temp_path, output_path)
+        return merged
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _stream_csv_merge(id_key, input_file, output_file, patch_handler, csv_args):
+    advise_sequential(input_file)
+    reader = csv.reader(input_file, **csv_args)
+    header = [key.strip() for key in next(reader, [])]
+    rows = (row for row in reader if row)
+    first_row = next(rows, None)
+    # Like the dict based merge, the input columns are only written if the input has rows
+    input_field_names = set(header) if first_row is not None else set()
+    field_names = tuple(sorted(input_field_names.union(patch_handler.infer_field_names())))
+    writer = csv.writer(output_file, **csv_args)
+    writer.writerow(field_names)
+    if first_row is not None:
+        rows = itertools.chain((first_row,), rows)
+
+    patch_index = patch_handler.data
+    seen_keys = set()
+    pop_patch = patch_index.pop
+    header_length = len(header)
+    for row in rows:
+        entry = dict(zip(header, map(str.strip, row)))
+        entry_key = entry.get(id_key, None)
+        if len(row) != header_length:
+            if len(row) > header_length and "None" not in field_names:
+                # The surplus values need a column the already written header does not have
+                return False
+            complete_ragged_entry(entry, header, row)
+        if entry_key in seen_keys:
+            return False
+        seen_keys.add(entry_key)
+        patch_entry = pop_patch(entry_key, None)
+        if patch_entry is not None:
+            entry.update(patch_entry)
+        writer.writerow([entry.get(field, "") for field in field_names])
+    # Patch entries without a counterpart in the input are new entries
+    writer.writerows([entry.get(field, "") for field in field_names] for entry in patch_index.values())
+    return True
 
 
 def merge_data(
@@ -262,6 +561,19 @@ def merge_data(
         return f"The provided path '{patch_path}' does not exist!"
 
     try:
+        if input_type == "csv" and patch_type == "csv":
+            parsed_input_csv_args = parse_csv_args(input_csv_args)
+            parsed_patch_csv_args = parse_csv_args(patch_csv_args)
+            if merge_csv_files_streaming(
+                    id_key,
+                    input_path,
+                    patch_path,
+                    output_path,
+                    parsed_input_csv_args,
+                    parsed_patch_csv_args,
+            ):
+                return None
+
         if input_type == "json":
             input_handler = MergeableJSONData(input_path, id_key, json_path=input_sub_path)
         else:
@@ -1,12 +1,31 @@
 #!/usr/bin/env python3
 
 import argparse
+import base64
+import hashlib
+import json
+import mmap
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.poolmanager import PoolKey
+from urllib3.util.retry import Retry
 import os.path
+import random
 import sys
-from urllib.parse import unquote
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from urllib.parse import quote, unquote
 import re
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Custom exceptions for OneDrive operations
 # Error codes for different failure scenarios
 ERROR_ACCESS_TOKEN = 10
@@ -17,6 +36,182 @@ ERROR_UPLOAD_FILE = 50
 ERROR_GET_WEB_URL = 60
 ERROR_FILE_NOT_FOUND = 70
 
+# Files up to this size are uploaded with a single request instead of an upload session
+SIMPLE_UPLOAD_LIMIT = 4 * 1024 * 1024
+
+# Upload session byte ranges have to be a multiple of 320 KiB and smaller than 60 MiB
+UPLOAD_FRAGMENT_SIZE = 327680
+MAX_UPLOAD_CHUNK_SIZE = 60 * 1024 * 1024 - UPLOAD_FRAGMENT_SIZE
+DEFAULT_CHUNK_SIZE_MIB = 32
+UPLOAD_CONCURRENCY = 8
+
+# Body for creating a folder, only the JSON encoded name differs between folders.
+# Never replace a folder created concurrently, an existing folder is just as good.
+FOLDER_PAYLOAD_TEMPLATE = b'{"name": %s, "folder": {}, "@microsoft.graph.conflictBehavior": "fail"}'
+
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+
+# Uploads overwrite existing files of the same name
+UPLOAD_SESSION_PAYLOAD = b'{"item": {"@microsoft.graph.conflictBehavior": "replace"}}'
+REPLACE_CONFLICT_QUERY = "@microsoft.graph.conflictBehavior=replace"
+
+# Folder and file lookups only request the properties they use, instead of the full drive item
+FOLDER_SELECT_QUERY = "$select=id,folder"
+WEB_URL_SELECT_QUERY = "$select=webUrl"
+
+# Properties compared to decide whether an existing file has the same content as the file to upload
+UNCHANGED_FILE_SELECT_QUERY = "$select=size,file,webUrl"
+
+# quickXorHash, the content hash OneDrive and SharePoint report for every file, XORs each byte into a 160 bit
+# register, shifted by 11 bits more than the byte before. The shift repeats every 160 bytes, so files are read in
+# blocks of a multiple of 160 bytes, which XOR into the same register positions.
+QUICK_XOR_WIDTH = 160
+QUICK_XOR_SHIFT = 11
+QUICK_XOR_READ_SIZE = QUICK_XOR_WIDTH * 8192
+
+# Graph JSON batching accepts up to 20 requests per batch
+GRAPH_BATCH_URL = f"{GRAPH_URL}/$batch"
+GRAPH_BATCH_LIMIT = 20
+
+# Files up to this size are uploaded together with Graph JSON batching, their content is sent base64 encoded
+BATCH_UPLOAD_FILE_LIMIT = 1024 * 1024
+# Upper bound for the encoded file content of a single batch request
+BATCH_UPLOAD_PAYLOAD_LIMIT = 4 * 1024 * 1024
+
+# Access tokens are reused until shortly before they expire, keyed by a hash of the credentials they were issued for.
+# The least recently used tokens are evicted beyond TOKEN_CACHE_SIZE entries.
+TOKEN_EXPIRY_MARGIN = 60
+TOKEN_CACHE_SIZE = 256
+_TOKEN_CACHE = OrderedDict()
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+# Drive IDs by tenant and drive URL, a SharePoint site or user keeps its drive.
+# The least recently used drive IDs are evicted beyond DRIVE_ID_CACHE_SIZE entries.
+DRIVE_ID_CACHE_SIZE = 1024
+_DRIVE_ID_CACHE = OrderedDict()
+_DRIVE_ID_CACHE_LOCK = threading.Lock()
+
+# Folders known to exist, as (root path, folder path) keys, so repeated uploads into them skip the folder lookups.
+# The least recently used folders are evicted beyond FOLDER_CACHE_SIZE entries.
+FOLDER_CACHE_SIZE = 4096
+_FOLDER_CACHE = OrderedDict()
+_FOLDER_CACHE_LOCK = threading.Lock()
+
+# Connect and read timeouts in seconds, so a stalled connection fails instead of blocking the upload forever.
+# Uploads get a longer read timeout, Graph may take a while to acknowledge a large chunk.
+REQUEST_TIMEOUT = (5, 30)
+UPLOAD_TIMEOUT = (5, 120)
+
+# Source files are read in large blocks while they are streamed to Graph, http.client sends file bodies
+# block by block, so the connections use the same block size
+FILE_BUFFER_SIZE = 1024 * 1024
+
+class GraphHTTPAdapter(HTTPAdapter):
+    """HTTP adapter applying REQUEST_TIMEOUT to requests sent without an explicit timeout and
+    FILE_BUFFER_SIZE to new connections"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        # urllib3 before 2.0 does not accept a block size for its connections
+        if 'key_blocksize' in PoolKey._fields:
+            kwargs.setdefault('blocksize', FILE_BUFFER_SIZE)
+        super().init_poolmanager(*args, **kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = REQUEST_TIMEOUT
+        return super().send(request, timeout=timeout, **kwargs)
+
+# Statuses Graph answers with when it throttles requests
+THROTTLE_STATUSES = frozenset([429, 503])
+# Concurrent throttled responses only lower the upload concurrency once within this many seconds
+THROTTLE_COOLDOWN = 1.0
+
+class AdaptiveConcurrencyLimiter:
+    """Limits the number of concurrent uploads.
+
+    The limit is halved when Graph throttles requests and raised again by one after about limit successful uploads.
+    """
+
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.active = 0
+        self.last_decrease = None
+        self._condition = threading.Condition()
+
+    def throttled(self):
+        with self._condition:
+            now = time.monotonic()
+            if self.last_decrease is None or now - self.last_decrease >= THROTTLE_COOLDOWN:
+                self.limit = max(1.0, self.limit / 2)
+                self.last_decrease = now
+
+    def __enter__(self):
+        with self._condition:
+            while self.active >= int(self.limit):
+                self._condition.wait()
+            self.active += 1
+        # Throttled responses of this thread's requests lower this limiter
+        _ACTIVE_LIMITER.limiter = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _ACTIVE_LIMITER.limiter = None
+        with self._condition:
+            self.active -= 1
+            if exc_type is None:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+        return False
+
+# Upload limiters by tenant, client and maximum concurrency. Graph throttles per application and tenant,
+# and uploads with a different maximum get their own limiter, so they do not change each other's limit.
+_UPLOAD_LIMITERS = {}
+_UPLOAD_LIMITERS_LOCK = threading.Lock()
+# The limiter the current thread uploads with
+_ACTIVE_LIMITER = threading.local()
+
+def get_upload_limiter(tenant_id, client_id, concurrency=None):
+    """Get the upload limiter shared by the uploads of an application with the same maximum concurrency."""
+    max_limit = max(1, int(concurrency or UPLOAD_CONCURRENCY))
+    key = (tenant_id, client_id, max_limit)
+    with _UPLOAD_LIMITERS_LOCK:
+        limiter = _UPLOAD_LIMITERS.get(key)
+        if limiter is None:
+            limiter = _UPLOAD_LIMITERS[key] = AdaptiveConcurrencyLimiter(max_limit)
+        return limiter
+
+class ThrottleAwareRetry(Retry):
+    """Retry adding jitter to the backoff and lowering the upload concurrency when Graph throttles requests"""
+
+    def get_backoff_time(self):
+        # Spread the retries of concurrent uploads, so they do not hit Graph at the same time again
+        backoff = super().get_backoff_time()
+        return backoff * random.uniform(0.5, 1.5)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        limiter = getattr(_ACTIVE_LIMITER, 'limiter', None)
+        if limiter is not None and response is not None and response.status in THROTTLE_STATUSES:
+            limiter.throttled()
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+# Shared session, so consecutive requests reuse the same TCP/TLS connection
+_SESSION = requests.Session()
+_SESSION.mount('https://', GraphHTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=50,
+    # Graph throttles with 429 and a Retry-After header, which is waited for before retrying
+    max_retries=ThrottleAwareRetry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET', 'POST', 'PUT'],
+        respect_retry_after_header=True,
+        # Hand the last response to the callers, so they can report the error message
+        raise_on_status=False,
+    ),
+))
+
 class OneDriveError(Exception):
     """Base class for OneDrive exceptions"""
 
@@ -70,6 +265,9 @@ class CannotUploadFile(OneDriveError):
     def __init__(self, message):
         super().__init__(message, ERROR_UPLOAD_FILE)
 
+class UploadParentNotFound(CannotUploadFile):
+    """Raised when the folder a file is uploaded into does not exist"""
+
 class WebUrlError(OneDriveError):
     """Raised when there's an error getting the web URL"""
 
@@ -78,7 +276,7 @@ class WebUrlError(OneDriveError):
     def __init__(self, message):
         super().__init__(message, ERROR_GET_WEB_URL)
 
-class FileNotFoundError(OneDriveError):
+class SourceFileNotFoundError(OneDriveError):
     """Raised when the source file is not found"""
 
     base_description = "Source file not found"
@@ -86,8 +284,42 @@ class FileNotFoundError(OneDriveError):
     def __init__(self, message):
         super().__init__(message, ERROR_FILE_NOT_FOUND)
 
+def parse_json(response):
+    """Parse the JSON body of a response, using orjson if it is available."""
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+def dump_json(data):
+    """Serialize data to a JSON request body, using orjson if it is available."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode('utf-8')
+
+@dataclass(frozen=True)
+class CachedToken:
+    """Access token along with the monotonic time it is renewed at"""
+
+    access_token: str
+    expires_at: float
+
+def get_token_cache_key(tenant_id, client_id, client_secret, scopes):
+    """Get the token cache key for a set of credentials, without keeping the secret in plain text."""
+    credentials = '\0'.join((tenant_id, client_id, client_secret, scopes))
+    return hashlib.sha256(credentials.encode('utf-8')).digest()
+
 def get_access_token(tenant_id, client_id, client_secret, scopes):
     """Get access token from Microsoft Graph API."""
+    cache_key = get_token_cache_key(tenant_id, client_id, client_secret, scopes)
+    with _TOKEN_CACHE_LOCK:
+        cached_token = _TOKEN_CACHE.get(cache_key)
+        if cached_token is not None:
+            if time.monotonic() < cached_token.expires_at:
+                _TOKEN_CACHE.move_to_end(cache_key)
+                return cached_token.access_token
+            # Expired tokens are dropped, a new one is requested below
+            del _TOKEN_CACHE[cache_key]
+
     try:
         token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
         
@@ -98,14 +330,24 @@ def get_access_token(tenant_id, client_id, client_secret, scopes):
             'scope': scopes
         }
         
-        response = requests.post(token_url, data=data)
+        response = _SESSION.post(token_url, data=data)
         
         if response.status_code != 200:
             raise AccessTokenError(f"Failed to get access token: {response.text}")
             
-        access_token = response.json().get('access_token')
+        token_info = parse_json(response)
+        access_token = token_info.get('access_token')
         if not access_token:
             raise AccessTokenError("Access token not found in response")
+
+        expires_in = token_info.get('expires_in')
+        if expires_in:
+            expires_at = time.monotonic() + int(expires_in) - TOKEN_EXPIRY_MARGIN
+            with _TOKEN_CACHE_LOCK:
+                _TOKEN_CACHE[cache_key] = CachedToken(access_token, expires_at)
+                _TOKEN_CACHE.move_to_end(cache_key)
+                while len(_TOKEN_CACHE) > TOKEN_CACHE_SIZE:
+                    _TOKEN_CACHE.popitem(last=False)
             
         return access_token
     except requests.exceptions.RequestException as e:
@@ -115,70 +357,127 @@ def get_access_token(tenant_id, client_id, client_secret, scopes):
             raise AccessTokenError(f"Unexpected error getting access token: {str(e)}")
         raise
 
-def get_drive_id(access_token, sharepoint_url):
+# Parts of SharePoint URLs
+_DOCUMENTS_RE = re.compile(r'Documents/([^?#]*)')
+_QUERY_DOCUMENTS_RE = re.compile(r'Documents/([^&]*)')
+_ID_PARAM_RE = re.compile(r'[?&]id=([^&#]+)')
+_PERSONAL_RE = re.compile(r'/personal(?:/([^/?#]*))?(?:[/?#]|$)')
+
+@dataclass(frozen=True)
+class SharePointLocation:
+    """Parts of a SharePoint URL needed to address its drive and folders"""
+
+    is_personal: bool
+    hostname: str
+    site_path: str
+    user_id: str = None
+    user_id_error: str = None
+    documents_base_path: str = None
+    documents_base_path_error: str = None
+
+def parse_documents_base_path(decoded_url):
+    """Get the folder path below 'Documents' of a decoded SharePoint URL, along with an error message if there is none."""
+    # For URLs with encoded paths in query parameters
+    if 'id=' in decoded_url:
+        # Extract the encoded path from the id parameter
+        id_match = _ID_PARAM_RE.search(decoded_url)
+        if not id_match:
+            return None, "Could not find valid path in SharePoint URL query parameter"
+        # Decode the path and extract everything after Documents/ up to the first &
+        documents_match = _QUERY_DOCUMENTS_RE.search(unquote(id_match.group(1)))
+        if not documents_match:
+            return None, "Could not find 'Documents' in SharePoint URL query parameter"
+    else:
+        # Extract everything between Documents/ and the first ? or #
+        documents_match = _DOCUMENTS_RE.search(decoded_url)
+        if not documents_match:
+            return None, "Could not find 'Documents' in SharePoint URL"
+
+    # Remove any trailing slashes
+    return documents_match.group(1).rstrip('/'), None
+
+@lru_cache(maxsize=64)
+def parse_sharepoint_url(sharepoint_url):
+    """Parse a SharePoint URL once into the parts needed to address its drive and folders."""
+    # Decode the URL first
+    decoded_url = unquote(sharepoint_url)
+    url_parts = decoded_url.split('://')[-1].split('/')
+
+    # For personal OneDrive (URLs containing '-my.sharepoint.com')
+    is_personal = '-my.sharepoint.com' in decoded_url
+    user_id = None
+    user_id_error = None
+    if is_personal:
+        # Extract user information from the URL
+        personal_match = _PERSONAL_RE.search(decoded_url)
+        if not personal_match:
+            user_id_error = "Could not find 'personal' in SharePoint URL"
+        elif not personal_match.group(1):
+            user_id_error = "Could not find user ID in SharePoint URL"
+        else:
+            # Convert user_id from URL format back to email format
+            user_id = personal_match.group(1).replace('_', '@', 1).replace('_', '.')
+
+    documents_base_path, documents_base_path_error = parse_documents_base_path(decoded_url)
+
+    return SharePointLocation(
+        is_personal=is_personal,
+        hostname=url_parts[0],
+        site_path='/'.join(url_parts[1:]),
+        user_id=user_id,
+        user_id_error=user_id_error,
+        documents_base_path=documents_base_path,
+        documents_base_path_error=documents_base_path_error,
+    )
+
+def get_drive_id(access_token, sharepoint_url, tenant_id=None):
     """Get the drive ID and user ID (for personal OneDrive) from the SharePoint site."""
     try:
-        # Decode the URL first
-        decoded_url = unquote(sharepoint_url)
-        
-        # For personal OneDrive (URLs containing '-my.sharepoint.com')
-        if '-my.sharepoint.com' in decoded_url:
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Extract user information from the URL
-            url_parts = decoded_url.split('://')[-1].split('/')
-            if 'personal' not in url_parts:
-                raise DriveIdError("Could not find 'personal' in SharePoint URL")
-                
-            personal_index = url_parts.index('personal')
-            if personal_index + 1 >= len(url_parts):
-                raise DriveIdError("Could not find user ID in SharePoint URL")
-                
-            user_id = url_parts[personal_index + 1]
-            # Convert user_id from URL format back to email format
-            user_id = user_id.replace('_', '@', 1).replace('_', '.')
+        location = parse_sharepoint_url(sharepoint_url)
+
+        if location.is_personal:
+            if location.user_id_error:
+                raise DriveIdError(location.user_id_error)
+            user_id = location.user_id
             
             # Get the drive using the user's ID
-            drive_url = f"https://graph.microsoft.com/v1.0/users/{user_id}/drive"
-            response = requests.get(drive_url, headers=headers)
-            
-            if response.status_code != 200:
-                raise DriveIdError(f"Error getting drive ID: {response.text}")
-            
-            drive_id = response.json().get('id')
-            if not drive_id:
-                raise DriveIdError("Drive ID not found in response")
-                
-            return drive_id, user_id
+            drive_url = f"{GRAPH_URL}/users/{user_id}/drive"
         else:
-            # For SharePoint sites
-            url_parts = decoded_url.split('://')[-1].split('/')
-            hostname = url_parts[0]
-            site_path = '/'.join(url_parts[1:])
-            
-            # Construct the site ID
-            site_id = f"{hostname}:/{site_path}"
-            
-            # Get the drive ID
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            drive_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive"
-            response = requests.get(drive_url, headers=headers)
-            
-            if response.status_code != 200:
-                raise DriveIdError(f"Error getting drive ID: {response.text}")
+            # For SharePoint sites, construct the site ID
+            user_id = None
+            site_id = f"{location.hostname}:/{location.site_path}"
+            drive_url = f"{GRAPH_URL}/sites/{site_id}/drive"
+
+        cache_key = (tenant_id, drive_url)
+        with _DRIVE_ID_CACHE_LOCK:
+            drive_id = _DRIVE_ID_CACHE.get(cache_key)
+            if drive_id:
+                _DRIVE_ID_CACHE.move_to_end(cache_key)
+        if drive_id:
+            return drive_id, user_id
+
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+
+        # Only the ID is needed, leave out the owner and quota details
+        response = _SESSION.get(f"{drive_url}?$select=id", headers=headers)
+        
+        if response.status_code != 200:
+            raise DriveIdError(f"Error getting drive ID: {response.text}")
+        
+        drive_id = parse_json(response).get('id')
+        if not drive_id:
+            raise DriveIdError("Drive ID not found in response")
+
+        with _DRIVE_ID_CACHE_LOCK:
+            _DRIVE_ID_CACHE[cache_key] = drive_id
+            _DRIVE_ID_CACHE.move_to_end(cache_key)
+            while len(_DRIVE_ID_CACHE) > DRIVE_ID_CACHE_SIZE:
+                _DRIVE_ID_CACHE.popitem(last=False)
             
-            drive_id = response.json().get('id')
-            if not drive_id:
-                raise DriveIdError("Drive ID not found in response")
-                
-            return drive_id, None
+        return drive_id, user_id
     except requests.exceptions.RequestException as e:
         raise DriveIdError(f"Network error while getting drive ID: {str(e)}")
     except Exception as e:
@@ -186,10 +485,28 @@ def get_drive_id(access_token, sharepoint_url):
             raise DriveIdError(f"Unexpected error getting drive ID: {str(e)}")
         raise
 
+def get_drive_root_path(drive_id, user_id=None):
+    """Get the path of a drive's root item, relative to the Graph API URL."""
+    if user_id:
+        return f"/users/{user_id}/drive/items/root"
+    return f"/drives/{drive_id}/items/root"
+
+def get_item_path(root_path, *item_paths):
+    """Get the path of a drive item below a root item, relative to the Graph API URL.
+
+    The item paths are joined and each of their segments is percent encoded, so a name containing e.g. '%', '#'
+    or '?' addresses the same item in direct and batched requests.
+    """
+    segments = [segment for item_path in item_paths for segment in item_path.split('/') if segment]
+    if not segments:
+        return root_path
+    return f"{root_path}:/{'/'.join(quote(segment, safe='') for segment in segments)}"
+
+@lru_cache(maxsize=256)
 def get_full_folder_path(sharepoint_url, onedrive_folder_path):
     """Get the full folder path by combining SharePoint URL path and OneDrive folder path."""
     try:
-        if not onedrive_folder_path.startswith('./') and not onedrive_folder_path.startswith('/'):
+        if not onedrive_folder_path.startswith(('./', '/')):
             raise FolderPathError("OneDrive folder path must start with './' for relative paths or '/' for absolute paths")
 
         if onedrive_folder_path.startswith('/'):
@@ -197,69 +514,78 @@ def get_full_folder_path(sharepoint_url, onedrive_folder_path):
             return onedrive_folder_path[1:]
 
         # Handle relative paths starting with ./
-        # First decode the URL
-        decoded_url = unquote(sharepoint_url)
-        
-        # For URLs with encoded paths in query parameters
-        if 'id=' in decoded_url:
-            # Extract the encoded path from the id parameter
-            query_parts = decoded_url.split('?')[1].split('&')
-            for part in query_parts:
-                if part.startswith('id='):
-                    encoded_path = part.split('=')[1]
-                    # Decode the path
-                    path_str = unquote(encoded_path)
-                    # Find Documents and extract everything up to the first &
-                    if 'Documents' not in path_str:
-                        raise FolderPathError("Could not find 'Documents' in SharePoint URL query parameter")
-                    
-                    path_parts = path_str.split('Documents/')[1].split('&')[0]
-                    # Remove any trailing slashes
-                    base_path = path_parts.rstrip('/')
-                    # Combine with the relative path (removing ./)
-                    return f"{base_path}/{onedrive_folder_path[2:]}"
-            raise FolderPathError("Could not find valid path in SharePoint URL query parameter")
-        else:
-            # Regular URL processing
-            if 'Documents' not in decoded_url:
-                raise FolderPathError("Could not find 'Documents' in SharePoint URL")
-                
-            # Extract everything between Documents/ and the first ? or #
-            base_url = decoded_url.split('Documents/')[1]
-            base_path = base_url.split('?')[0].split('#')[0].rstrip('/')
-            return f"{base_path}/{onedrive_folder_path[2:]}"
+        location = parse_sharepoint_url(sharepoint_url)
+        if location.documents_base_path_error:
+            raise FolderPathError(location.documents_base_path_error)
+
+        # Combine with the relative path (removing ./)
+        return f"{location.documents_base_path}/{onedrive_folder_path[2:]}"
             
     except FolderPathError:
         raise
     except Exception as e:
         raise FolderPathError(f"Error processing folder path: {str(e)}")
 
-def verify_folder_path(access_token, drive_id, folder_path, create_missing=False, user_id=None):
+def get_folder_cache_key(root_path, folder_path):
+    """Get the folder cache key of a folder path, independent of leading and trailing slashes."""
+    return root_path, folder_path.strip('/')
+
+def is_folder_cached(root_path, folder_path):
+    """Check whether a folder is known to exist."""
+    key = get_folder_cache_key(root_path, folder_path)
+    with _FOLDER_CACHE_LOCK:
+        if key not in _FOLDER_CACHE:
+            return False
+        _FOLDER_CACHE.move_to_end(key)
+        return True
+
+def cache_folder(root_path, folder_path):
+    """Remember that a folder exists."""
+    key = get_folder_cache_key(root_path, folder_path)
+    with _FOLDER_CACHE_LOCK:
+        _FOLDER_CACHE[key] = None
+        _FOLDER_CACHE.move_to_end(key)
+        while len(_FOLDER_CACHE) > FOLDER_CACHE_SIZE:
+            _FOLDER_CACHE.popitem(last=False)
+
+def invalidate_folder(root_path, folder_path):
+    """Forget a folder that turned out to be missing, along with its cached parents.
+
+    Cached subfolders are forgotten once an upload into them fails as well.
+    """
+    _, path = get_folder_cache_key(root_path, folder_path)
+    parts = path.split('/') if path else []
+    with _FOLDER_CACHE_LOCK:
+        for depth in range(len(parts) + 1):
+            _FOLDER_CACHE.pop((root_path, '/'.join(parts[:depth])), None)
+
+def verify_folder_path(access_token, root_path, folder_path, create_missing=False):
     """Verify that the folder path exists in OneDrive."""
     try:
         if create_missing:
-            return create_folder_path(access_token, drive_id, folder_path, user_id)
+            return create_folder_path(access_token, root_path, folder_path)
+
+        if is_folder_cached(root_path, folder_path):
+            return True
 
         headers = {
             'Authorization': f'Bearer {access_token}',
             'Content-Type': 'application/json'
         }
 
-        if user_id:
-            folder_url = f"https://graph.microsoft.com/v1.0/users/{user_id}/drive/items/root:{folder_path}"
-        else:
-            folder_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/root:{folder_path}"
+        folder_url = f"{GRAPH_URL}{get_item_path(root_path, folder_path)}?{FOLDER_SELECT_QUERY}"
             
         try:
-            response = requests.get(folder_url, headers=headers)
+            response = _SESSION.get(folder_url, headers=headers)
             
             if response.status_code != 200:
                 raise FolderPathError(f"Folder path '{folder_path}' does not exist")
                 
-            folder_info = response.json()
+            folder_info = parse_json(response)
             if not folder_info.get('folder'):
                 raise FolderPathError(f"Path '{folder_path}' exists but is not a folder")
-                
+
+            cache_folder(root_path, folder_path)
             return True
             
         except requests.exceptions.RequestException as e:
@@ -270,7 +596,37 @@ def verify_folder_path(access_token, drive_id, folder_path, create_missing=False
     except Exception as e:
         raise FolderPathError(f"Unexpected error verifying folder path: {str(e)}")
 
-def create_folder_path(access_token, drive_id, folder_path, user_id=None):
+def get_folder_items_batched(access_token, root_path, paths):
+    """Get the drive items of several paths with Graph JSON batching and return their responses in order."""
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+
+    responses = []
+    for offset in range(0, len(paths), GRAPH_BATCH_LIMIT):
+        batch_paths = paths[offset:offset + GRAPH_BATCH_LIMIT]
+        batch_data = {
+            "requests": [
+                {"id": str(index), "method": "GET", "url": f"{get_item_path(root_path, path)}?{FOLDER_SELECT_QUERY}"}
+                for index, path in enumerate(batch_paths)
+            ]
+        }
+        batch_response = _SESSION.post(GRAPH_BATCH_URL, headers=headers, data=dump_json(batch_data))
+
+        if batch_response.status_code != 200:
+            raise CannotCreateFolder(f"Error checking folders: {batch_response.text}")
+
+        # Batch responses may arrive in any order
+        responses_by_id = {r.get('id'): r for r in parse_json(batch_response).get('responses', [])}
+        for index, path in enumerate(batch_paths):
+            if str(index) not in responses_by_id:
+                raise CannotCreateFolder(f"Error checking folder '{path}': no response in batch")
+            responses.append(responses_by_id[str(index)])
+
+    return responses
+
+def create_folder_path(access_token, root_path, folder_path):
     """Create folder path in OneDrive if it doesn't exist."""
     try:
         headers = {
@@ -280,54 +636,61 @@ def create_folder_path(access_token, drive_id, folder_path, user_id=None):
 
         # Split the path into parts
         parts = [p for p in folder_path.split('/') if p]
-        current_path = ''
+        paths = ['/'.join(parts[:i + 1]) for i in range(len(parts))]
+        if not parts or is_folder_cached(root_path, folder_path):
+            return True
 
-        for part in parts:
-            # Update current path
-            current_path = f"{current_path}/{part}" if current_path else part
+        # Check the deepest folder first, usually the whole path exists already
+        check_url = f"{GRAPH_URL}{get_item_path(root_path, paths[-1])}?{FOLDER_SELECT_QUERY}"
+        response = _SESSION.get(check_url, headers=headers)
 
-            # Check if folder exists
-            if user_id:
-                check_url = f"https://graph.microsoft.com/v1.0/users/{user_id}/drive/items/root:{current_path}"
+        if response.status_code == 200:
+            if not parse_json(response).get('folder'):
+                raise CannotCreateFolder(f"Path component '{parts[-1]}' exists but is not a folder")
+            cache_folder(root_path, folder_path)
+            return True
+        elif response.status_code != 404:
+            raise CannotCreateFolder(f"Error checking folder '{parts[-1]}': {response.text}")
+
+        # Parents known to exist are not checked again
+        first_unknown = 0
+        for index in range(len(paths) - 2, -1, -1):
+            if is_folder_cached(root_path, paths[index]):
+                first_unknown = index + 1
+                break
+
+        # Check the remaining parent levels at once, everything below the first missing folder is missing as well
+        first_missing = len(parts) - 1
+        parent_responses = get_folder_items_batched(access_token, root_path, paths[first_unknown:-1])
+        for index, response in enumerate(parent_responses, first_unknown):
+            status = response.get('status')
+            if status == 404:
+                first_missing = index
+                break
+            elif status != 200:
+                raise CannotCreateFolder(f"Error checking folder '{parts[index]}': {response.get('body')}")
+            elif not (response.get('body') or {}).get('folder'):
+                # Folder exists, verify it's actually a folder
+                raise CannotCreateFolder(f"Path component '{parts[index]}' exists but is not a folder")
             else:
-                check_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/root:{current_path}"
-            response = requests.get(check_url, headers=headers)
-
-            if response.status_code == 404:
-                # Folder doesn't exist, create it
-                if user_id:
-                    parent_path = current_path.rsplit('/', 1)[0] if '/' in current_path else ''
-                    if parent_path:
-                        create_url = f"https://graph.microsoft.com/v1.0/users/{user_id}/drive/items/root:{parent_path}:/children"
-                    else:
-                        create_url = f"https://graph.microsoft.com/v1.0/users/{user_id}/drive/items/root/children"
-                else:
-                    parent_path = current_path.rsplit('/', 1)[0] if '/' in current_path else ''
-                    if parent_path:
-                        create_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/root:{parent_path}:/children"
-                    else:
-                        create_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/root/children"
-                
-                folder_data = {
-                    "name": part,
-                    "folder": {},
-                    "@microsoft.graph.conflictBehavior": "replace"
-                }
-                
-                create_response = requests.post(create_url, headers=headers, json=folder_data)
-                
-                if create_response.status_code not in [201, 200]:
-                    # If folder already exists, that's fine, continue
-                    if 'nameAlreadyExists' in create_response.text:
-                        continue
-                    raise CannotCreateFolder(f"Error creating folder '{part}': {create_response.text}")
-            elif response.status_code != 200:
-                raise CannotCreateFolder(f"Error checking folder '{part}': {response.text}")
+                cache_folder(root_path, paths[index])
+
+        for part, current_path in zip(parts[first_missing:], paths[first_missing:]):
+            # Folder doesn't exist, create it
+            parent_path = current_path.rsplit('/', 1)[0] if '/' in current_path else ''
+            if parent_path:
+                create_url = f"{GRAPH_URL}{get_item_path(root_path, parent_path)}:/children"
             else:
-                # Folder exists, verify it's actually a folder
-                folder_info = response.json()
-                if not folder_info.get('folder'):
-                    raise CannotCreateFolder(f"Path component '{part}' exists but is not a folder")
+                create_url = f"{GRAPH_URL}{root_path}/children"
+            
+            folder_data = FOLDER_PAYLOAD_TEMPLATE % dump_json(part)
+            
+            create_response = _SESSION.post(create_url, headers=headers, data=folder_data)
+            
+            # If folder already exists, that's fine, continue
+            if create_response.status_code not in [201, 200] and 'nameAlreadyExists' not in create_response.text:
+                raise CannotCreateFolder(f"Error creating folder '{part}': {create_response.text}")
+            cache_folder(root_path, current_path)
 
         return True
     except requests.exceptions.RequestException as e:
@@ -337,7 +700,35 @@ def create_folder_path(access_token, drive_id, folder_path, user_id=None):
             raise CannotCreateFolder(f"Unexpected error creating folder path: {str(e)}")
         raise
 
-def upload_file(access_token, drive_id, folder_path, source_content, file_name, user_id=None):
+def is_item_not_found(response):
+    """Check whether a Graph response reports a missing item."""
+    if response.status_code != 404:
+        return False
+    try:
+        return parse_json(response).get('error', {}).get('code') == 'itemNotFound'
+    except ValueError:
+        return False
+
+def get_upload_chunk_size(chunk_size_mib):
+    """Get the upload chunk size in bytes, rounded down to a multiple of the upload fragment size
+    and limited to MAX_UPLOAD_CHUNK_SIZE."""
+    if not chunk_size_mib:
+        chunk_size_mib = DEFAULT_CHUNK_SIZE_MIB
+    chunk_size = int(chunk_size_mib) * 1024 * 1024 // UPLOAD_FRAGMENT_SIZE * UPLOAD_FRAGMENT_SIZE
+    return min(max(chunk_size, UPLOAD_FRAGMENT_SIZE), MAX_UPLOAD_CHUNK_SIZE)
+
+def upload_chunk(upload_url, chunk, start, chunk_length, content_length):
+    """Upload a byte range of an upload session."""
+    headers = {
+        'Content-Length': str(chunk_length),
+        'Content-Range': f'bytes {start}-{start + chunk_length - 1}/{content_length}'
+    }
+
+    # Throttled or failed requests are retried by the session, which also rewinds streamed files
+    return _SESSION.put(upload_url, headers=headers, data=chunk, timeout=UPLOAD_TIMEOUT)
+
+def upload_file(access_token, root_path, folder_path, source_path, content_length, file_name,
+                chunk_size_mib=DEFAULT_CHUNK_SIZE_MIB):
     """Upload a file to OneDrive."""
     try:
         # First, create an upload session
@@ -347,48 +738,70 @@ def upload_file(access_token, drive_id, folder_path, source_content, file_name,
         }
         
         # Construct the upload session URL
-        # Make sure folder_path starts with a forward slash
-        full_path = f"/{folder_path}" if not folder_path.startswith('/') else folder_path
-        
-        if user_id:
-            upload_url = f"https://graph.microsoft.com/v1.0/users/{user_id}/drive/items/root:{full_path}/{file_name}:/createUploadSession"
-        else:
-            upload_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/root:{full_path}/{file_name}:/createUploadSession"
+        item_url = f"{GRAPH_URL}{get_item_path(root_path, folder_path, file_name)}"
+
+        if content_length <= SIMPLE_UPLOAD_LIMIT:
+            # Small files are uploaded directly, without the extra round trip for an upload session
+            simple_upload_headers = {
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/octet-stream'
+            }
+            with open(source_path, 'rb', buffering=FILE_BUFFER_SIZE) as source_file:
+                # Empty files are sent as an empty body, requests would send an empty stream chunked
+                upload_response = _SESSION.put(f"{item_url}:/content?{REPLACE_CONFLICT_QUERY}", headers=simple_upload_headers,
+                                               data=source_file if content_length else b'', timeout=UPLOAD_TIMEOUT)
+            if is_item_not_found(upload_response):
+                invalidate_folder(root_path, folder_path)
+                raise UploadParentNotFound(f"Folder '{folder_path}' does not exist")
+            if upload_response.status_code not in [200, 201]:
+                raise CannotUploadFile(f"Failed to upload file: {upload_response.text}")
+            return get_uploaded_file_web_url(upload_response, access_token, root_path, folder_path, file_name)
+
+        upload_url = f"{item_url}:/createUploadSession"
         
         # Create upload session
         try:
-            session_response = requests.post(upload_url, headers=headers)
+            session_response = _SESSION.post(upload_url, headers=headers, data=UPLOAD_SESSION_PAYLOAD)
             
+            if is_item_not_found(session_response):
+                invalidate_folder(root_path, folder_path)
+                raise UploadParentNotFound(f"Folder '{folder_path}' does not exist")
             if session_response.status_code != 200:
                 raise CannotUploadFile(f"Failed to create upload session: {session_response.text}")
             
             # Get the upload URL from the session
-            upload_url = session_response.json().get('uploadUrl')
+            upload_url = parse_json(session_response).get('uploadUrl')
             if not upload_url:
                 raise CannotUploadFile("Upload URL not found in session response")
         except requests.exceptions.RequestException as e:
             raise CannotUploadFile(f"Network error while creating upload session: {str(e)}")
         
-        # Upload the file content
-        content_length = len(source_content)
-        
-        # For small files (< 4MB), upload in a single request
-        headers = {
-            'Content-Length': str(content_length),
-            'Content-Range': f'bytes 0-{content_length-1}/{content_length}'
-        }
-        
-        upload_response = requests.put(upload_url, headers=headers, data=source_content)
-        
-        if upload_response.status_code not in [200, 201, 202]:
-            raise CannotUploadFile(f"Failed to upload file: {upload_response.text}")
+        chunk_size = get_upload_chunk_size(chunk_size_mib)
+        if content_length <= chunk_size:
+            # The file fits into a single chunk, stream it straight from the file
+            with open(source_path, 'rb', buffering=FILE_BUFFER_SIZE) as source_file:
+                upload_response = upload_chunk(upload_url, source_file, 0, content_length, content_length)
+
+            if upload_response.status_code not in [200, 201, 202]:
+                raise CannotUploadFile(f"Failed to upload file: {upload_response.text}")
+
+            return get_uploaded_file_web_url(upload_response, access_token, root_path, folder_path, file_name)
+
+        # Upload the file content in consecutive chunks, the upload session only accepts them in order.
+        # The file is mapped into memory, so only the chunk being sent gets read.
+        with open(source_path, 'rb') as source_file, \
+                mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ) as source_map:
+            # The file is read front to back once, let the kernel read ahead and drop pages behind it
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                source_map.madvise(mmap.MADV_SEQUENTIAL)
+            for start in range(0, content_length, chunk_size):
+                chunk = source_map[start:start + chunk_size]
+                upload_response = upload_chunk(upload_url, chunk, start, len(chunk), content_length)
+
+                if upload_response.status_code not in [200, 201, 202]:
+                    raise CannotUploadFile(f"Failed to upload file: {upload_response.text}")
         
-        # Get the file web URL
-        web_url = get_file_web_url(access_token, drive_id, folder_path, file_name, user_id)
-        if not web_url:
-            raise WebUrlError("Failed to get web URL for uploaded file")
-            
-        return web_url
+        return get_uploaded_file_web_url(upload_response, access_token, root_path, folder_path, file_name)
         
     except requests.exceptions.RequestException as e:
         raise CannotUploadFile(f"Network error while uploading file: {str(e)}")
@@ -397,29 +810,106 @@ def upload_file(access_token, drive_id, folder_path, source_content, file_name,
             raise CannotUploadFile(f"Unexpected error uploading file: {str(e)}")
         raise
 
-def get_file_web_url(access_token, drive_id, folder_path, file_name, user_id=None):
-    """Get the web URL for viewing the file in OneDrive."""
+def upload_files_batched(access_token, root_path, folder_path, files):
+    """Upload small files with a single Graph JSON batch request.
+
+    files is a list of (source_path, file_name) tuples. Returns the web URLs in the same order,
+    with None for files that failed within the batch or for all files if the batch request failed.
+    """
     try:
         headers = {
             'Authorization': f'Bearer {access_token}',
             'Content-Type': 'application/json'
         }
+
+        batch_requests = []
+        for index, (source_path, file_name) in enumerate(files):
+            with open(source_path, 'rb') as source_file:
+                body = base64.b64encode(source_file.read()).decode('ascii')
+            batch_requests.append({
+                "id": str(index),
+                "method": "PUT",
+                "url": f"{get_item_path(root_path, folder_path, file_name)}:/content?{REPLACE_CONFLICT_QUERY}",
+                # Graph decodes base64 bodies of requests with a non-JSON content type
+                "headers": {"Content-Type": "application/octet-stream"},
+                "body": body,
+            })
+
+        batch_response = _SESSION.post(GRAPH_BATCH_URL, headers=headers, data=dump_json({"requests": batch_requests}),
+                                       timeout=UPLOAD_TIMEOUT)
+
+        if batch_response.status_code != 200:
+            # e.g. a batch rejected as too large, its files are uploaded one by one instead
+            return [None] * len(files)
+
+        # Batch responses may arrive in any order
+        responses_by_id = {r.get('id'): r for r in parse_json(batch_response).get('responses', [])}
+        web_urls = []
+        for index in range(len(files)):
+            response = responses_by_id.get(str(index)) or {}
+            if response.get('status') in [200, 201]:
+                web_urls.append((response.get('body') or {}).get('webUrl'))
+            else:
+                web_urls.append(None)
+
+        return web_urls
+    except requests.exceptions.RequestException as e:
+        raise CannotUploadFile(f"Network error while uploading files: {str(e)}")
+    except Exception as e:
+        if not isinstance(e, OneDriveError):
+            raise CannotUploadFile(f"Unexpected error uploading files: {str(e)}")
+        raise
+
+def group_batch_uploads(indexes, content_lengths, batch_size):
+    """Group the indexes of small files into batches, limited by the number of requests and the encoded content size."""
+    batches = []
+    batch = []
+    payload_size = 0
+    for index in indexes:
+        # base64 encoding grows the content by a third
+        encoded_length = (content_lengths[index] + 2) // 3 * 4
+        if batch and (len(batch) >= batch_size or payload_size + encoded_length > BATCH_UPLOAD_PAYLOAD_LIMIT):
+            batches.append(batch)
+            batch = []
+            payload_size = 0
+        batch.append(index)
+        payload_size += encoded_length
+    if batch:
+        batches.append(batch)
+    return batches
+
+def get_uploaded_file_web_url(upload_response, access_token, root_path, folder_path, file_name):
+    """Get the web URL of an uploaded file, failing if there is none."""
+    # The response completing the upload already contains the drive item
+    web_url = None
+    if upload_response.status_code in [200, 201]:
+        try:
+            web_url = parse_json(upload_response).get('webUrl')
+        except ValueError:
+            pass
+    if not web_url:
+        web_url = get_file_web_url(access_token, root_path, folder_path, file_name)
+    if not web_url:
+        raise WebUrlError("Failed to get web URL for uploaded file")
         
-        # Make sure folder_path starts with a forward slash
-        path_with_slash = f"/{folder_path}" if not folder_path.startswith('/') else folder_path
-        full_path = f"{path_with_slash}/{file_name}"
+    return web_url
+
+def get_file_web_url(access_token, root_path, folder_path, file_name):
+    """Get the web URL for viewing the file in OneDrive."""
+    try:
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
         
         # Get file information including webUrl
-        if user_id:
-            file_url = f"https://graph.microsoft.com/v1.0/users/{user_id}/drive/items/root:{full_path}"
-        else:
-            file_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/items/root:{full_path}"
-        response = requests.get(file_url, headers=headers)
+        file_url = f"{GRAPH_URL}{get_item_path(root_path, folder_path, file_name)}?{WEB_URL_SELECT_QUERY}"
+        response = _SESSION.get(file_url, headers=headers)
         
         if response.status_code != 200:
             raise WebUrlError(f"Error getting file web URL: {response.text}")
             
-        web_url = response.json().get('webUrl')
+        web_url = parse_json(response).get('webUrl')
         if not web_url:
             raise WebUrlError("Web URL not found in response")
             
@@ -431,44 +921,218 @@ def get_file_web_url(access_token, drive_id, folder_path, file_name, user_id=Non
             raise WebUrlError(f"Unexpected error getting web URL: {str(e)}")
         raise
 
+def get_quick_xor_hash(source_path):
+    """Get the base64 encoded quickXorHash of a file."""
+    columns = 0
+    length = 0
+    with open(source_path, 'rb') as source_file:
+        while True:
+            block = source_file.read(QUICK_XOR_READ_SIZE)
+            if not block:
+                break
+            length += len(block)
+            # XOR all 160 byte columns of the block into one by folding it in halves, a short last block is zero padded
+            value = int.from_bytes(block, 'little')
+            bits = QUICK_XOR_READ_SIZE * 8
+            while bits > QUICK_XOR_WIDTH * 8:
+                bits //= 2
+                value = (value & ((1 << bits) - 1)) ^ (value >> bits)
+            columns ^= value
+
+    # Rotate each column byte into its position of the register
+    digest = 0
+    for index, byte in enumerate(columns.to_bytes(QUICK_XOR_WIDTH, 'little')):
+        shift = index * QUICK_XOR_SHIFT % QUICK_XOR_WIDTH
+        digest ^= (byte << shift) | (byte >> (QUICK_XOR_WIDTH - shift))
+    digest &= (1 << QUICK_XOR_WIDTH) - 1
+    # The file length is XORed into the last 64 bits
+    digest ^= length << (QUICK_XOR_WIDTH - 64)
+    return base64.b64encode(digest.to_bytes(QUICK_XOR_WIDTH // 8, 'little')).decode('ascii')
+
+def get_sha256_hash(source_path):
+    """Get the uppercase hex encoded SHA-256 hash of a file."""
+    with open(source_path, 'rb') as source_file:
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(source_file, 'sha256').hexdigest().upper()
+        file_hash = hashlib.sha256()
+        for block in iter(lambda: source_file.read(FILE_BUFFER_SIZE), b''):
+            file_hash.update(block)
+        return file_hash.hexdigest().upper()
+
+def get_unchanged_file_web_url(access_token, root_path, folder_path, source_path, content_length, file_name):
+    """Get the web URL of an existing OneDrive file with the same content as the source file, or None if there is none."""
+    try:
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+
+        file_url = f"{GRAPH_URL}{get_item_path(root_path, folder_path, file_name)}?{UNCHANGED_FILE_SELECT_QUERY}"
+        response = _SESSION.get(file_url, headers=headers)
+
+        # Anything but an existing file is left to the upload, which also reports errors
+        if response.status_code != 200:
+            return None
+        item = parse_json(response)
+        if item.get('size') != content_length or not item.get('webUrl'):
+            return None
+
+        hashes = (item.get('file') or {}).get('hashes') or {}
+        if hashes.get('quickXorHash'):
+            unchanged = hashes['quickXorHash'] == get_quick_xor_hash(source_path)
+        elif hashes.get('sha256Hash'):
+            unchanged = hashes['sha256Hash'].upper() == get_sha256_hash(source_path)
+        else:
+            unchanged = False
+
+        return item['webUrl'] if unchanged else None
+    except (requests.exceptions.RequestException, ValueError, AttributeError):
+        # e.g. a malformed response body, the file is uploaded then
+        return None
+
+def get_source_file_size(source_file_path):
+    """Get the size of a source file, failing if it does not exist."""
+    try:
+        return os.stat(source_file_path).st_size
+    except OSError:
+        raise SourceFileNotFoundError(f"Source file not found: {source_file_path}")
+
 def put_onedrive(tenant_id, client_id, secret_key, sharepoint_url, onedrive_folder_path,
                  source_file_path, scopes='https://graph.microsoft.com/.default',
-                 create_missing_folders=True, onedrive_file_name=None):
-    """Upload content to OneDrive and return its web URL."""
+                 create_missing_folders=True, onedrive_file_name=None, chunk_size_mib=DEFAULT_CHUNK_SIZE_MIB,
+                 concurrency=UPLOAD_CONCURRENCY, skip_unchanged_files=False):
+    """Upload content to OneDrive and return its web URL.
+
+    With skip_unchanged_files, a file that already exists in OneDrive with the same size and content hash is not
+    uploaded again.
+    Uploads with the same credentials and concurrency share an upload limiter, so at most concurrency of them run
+    at the same time, fewer while Graph throttles requests. If it is not set, UPLOAD_CONCURRENCY applies.
+    """
     try:
-        # Read the file content
-        if not os.path.exists(source_file_path):
-            raise FileNotFoundError(f"Source file not found: {file_path}")
-            
+        upload_limiter = get_upload_limiter(tenant_id, client_id, concurrency)
+        content_length = get_source_file_size(source_file_path)
         source_file_name = os.path.basename(source_file_path)
-
-        with open(source_file_path, 'rb') as f:
-            source_content = f.read()
             
         # Get access token
         access_token = get_access_token(tenant_id, client_id, secret_key, scopes)
         
         # Get drive ID and user ID (for personal OneDrive)
-        drive_id, user_id = get_drive_id(access_token, sharepoint_url)
+        drive_id, user_id = get_drive_id(access_token, sharepoint_url, tenant_id)
+        root_path = get_drive_root_path(drive_id, user_id)
         
         # Get the full folder path
         full_folder_path = get_full_folder_path(sharepoint_url, onedrive_folder_path)
         
-        # Verify/create the folder path
-        if not verify_folder_path(access_token, drive_id, full_folder_path, create_missing_folders, user_id):
-            raise CannotCreateFolder(f"Failed to create or verify folder path: {full_folder_path}")
-        
         # Use onedrive_file_name if provided, otherwise use source_file_name
         file_name = onedrive_file_name if onedrive_file_name else source_file_name
-        
-        # Upload the file
-        return upload_file(access_token, drive_id, full_folder_path, source_content, file_name, user_id)
+
+        if skip_unchanged_files:
+            web_url = get_unchanged_file_web_url(access_token, root_path, full_folder_path, source_file_path,
+                                                 content_length, file_name)
+            if web_url:
+                return web_url
+
+        if not create_missing_folders:
+            # Verify the folder path
+            if not verify_folder_path(access_token, root_path, full_folder_path, False):
+                raise CannotCreateFolder(f"Failed to create or verify folder path: {full_folder_path}")
+            with upload_limiter:
+                return upload_file(access_token, root_path, full_folder_path, source_file_path, content_length,
+                                   file_name, chunk_size_mib)
+
+        # Upload the file right away, the folder path usually exists already
+        try:
+            with upload_limiter:
+                return upload_file(access_token, root_path, full_folder_path, source_file_path, content_length,
+                                   file_name, chunk_size_mib)
+        except UploadParentNotFound:
+            pass
+
+        # Create the folder path and upload the file again
+        if not create_folder_path(access_token, root_path, full_folder_path):
+            raise CannotCreateFolder(f"Failed to create or verify folder path: {full_folder_path}")
+        with upload_limiter:
+            return upload_file(access_token, root_path, full_folder_path, source_file_path, content_length,
+                               file_name, chunk_size_mib)
         
     except OneDriveError:
         raise
     except Exception as e:
         raise CannotUploadFile(f"Unexpected error uploading file: {str(e)}")
 
+def put_onedrive_many(tenant_id, client_id, secret_key, sharepoint_url, onedrive_folder_path,
+                      source_file_paths, scopes='https://graph.microsoft.com/.default',
+                      create_missing_folders=True, concurrency=UPLOAD_CONCURRENCY, batch_size=GRAPH_BATCH_LIMIT,
+                      chunk_size_mib=DEFAULT_CHUNK_SIZE_MIB, skip_unchanged_files=False):
+    """Upload several files into the same OneDrive folder and return their web URLs in the same order.
+
+    Up to concurrency files are uploaded at the same time, fewer while Graph throttles requests.
+    The upload limiter is shared with other uploads with the same credentials and concurrency, see put_onedrive.
+    If it is not set, UPLOAD_CONCURRENCY applies.
+    Files up to BATCH_UPLOAD_FILE_LIMIT are uploaded with Graph JSON batching, up to batch_size files per request.
+    A batch_size of 1 uploads every file with its own request.
+    With skip_unchanged_files, files that already exist in OneDrive with the same size and content hash are not
+    uploaded again.
+    """
+    try:
+        upload_limiter = get_upload_limiter(tenant_id, client_id, concurrency)
+        concurrency = upload_limiter.max_limit
+        content_lengths = [get_source_file_size(source_file_path) for source_file_path in source_file_paths]
+        file_names = [os.path.basename(source_file_path) for source_file_path in source_file_paths]
+
+        # The drive and folder lookups are shared by all files
+        access_token = get_access_token(tenant_id, client_id, secret_key, scopes)
+        drive_id, user_id = get_drive_id(access_token, sharepoint_url, tenant_id)
+        root_path = get_drive_root_path(drive_id, user_id)
+        full_folder_path = get_full_folder_path(sharepoint_url, onedrive_folder_path)
+        if not verify_folder_path(access_token, root_path, full_folder_path, create_missing_folders):
+            raise CannotCreateFolder(f"Failed to create or verify folder path: {full_folder_path}")
+
+        web_urls = [None] * len(source_file_paths)
+        batch_size = min(batch_size, GRAPH_BATCH_LIMIT)
+
+        def upload_batch(batch):
+            file_access_token = get_access_token(tenant_id, client_id, secret_key, scopes)
+            files = [(source_file_paths[index], file_names[index]) for index in batch]
+            with upload_limiter:
+                batch_web_urls = upload_files_batched(file_access_token, root_path, full_folder_path, files)
+            for index, web_url in zip(batch, batch_web_urls):
+                web_urls[index] = web_url
+
+        def upload(index):
+            # Served from the token cache, but renewed if it expires during long uploads
+            file_access_token = get_access_token(tenant_id, client_id, secret_key, scopes)
+            with upload_limiter:
+                web_urls[index] = upload_file(file_access_token, root_path, full_folder_path, source_file_paths[index],
+                                              content_lengths[index], file_names[index], chunk_size_mib)
+
+        def check_unchanged(index):
+            file_access_token = get_access_token(tenant_id, client_id, secret_key, scopes)
+            web_urls[index] = get_unchanged_file_web_url(file_access_token, root_path, full_folder_path,
+                                                         source_file_paths[index], content_lengths[index],
+                                                         file_names[index])
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            if skip_unchanged_files:
+                list(executor.map(check_unchanged, range(len(source_file_paths))))
+
+            if batch_size > 1:
+                small_file_indexes = [index for index, content_length in enumerate(content_lengths)
+                                      if content_length <= BATCH_UPLOAD_FILE_LIMIT and web_urls[index] is None]
+                batches = group_batch_uploads(small_file_indexes, content_lengths, batch_size)
+                list(executor.map(upload_batch, [batch for batch in batches if len(batch) > 1]))
+
+            # Large files, single small files and files that failed within a batch are uploaded one by one,
+            # which also retries throttled requests and reports the error of a failing file
+            list(executor.map(upload, [index for index, web_url in enumerate(web_urls) if web_url is None]))
+
+        return web_urls
+
+    except OneDriveError:
+        raise
+    except Exception as e:
+        raise CannotUploadFile(f"Unexpected error uploading file: {str(e)}")
+
 def main():
     parser = argparse.ArgumentParser(description='Upload a file to Microsoft OneDrive')
     
@@ -505,10 +1169,18 @@ def main():
                       help='Name of the source file to upload')
     parser.add_argument('--onedrive-file-name',
                       help='Name of the file as it will appear in OneDrive. If not specified, uses the source file name')
+    parser.add_argument('--chunk-size-mib',
+                      type=int,
+                      default=DEFAULT_CHUNK_SIZE_MIB,
+                      help=f'Size of the chunks large files are uploaded in, in MiB (default: {DEFAULT_CHUNK_SIZE_MIB})')
     parser.add_argument('--create-missing-folders',
                       choices=['yes', 'no'],
                       default='yes',
                       help='Create missing folders in the OneDrive path (default: yes)')
+    parser.add_argument('--skip-unchanged-files',
+                      choices=['yes', 'no'],
+                      default='no',
+                      help='Skip the upload if the file exists in OneDrive with the same content (default: no)')
     
     args = parser.parse_args()
     
@@ -522,7 +1194,9 @@ def main():
             os.path.join(args.source_folder_path, args.source_file_name),
             scopes=args.scopes,
             create_missing_folders=args.create_missing_folders == 'yes',
-            onedrive_file_name=args.onedrive_file_name
+            onedrive_file_name=args.onedrive_file_name,
+            chunk_size_mib=args.chunk_size_mib,
+            skip_unchanged_files=args.skip_unchanged_files == 'yes'
         )
         
         if web_url:
@@ -167,6 +167,36 @@ PROPERTY_DESCRIPTION = [
         "default_value": None,
         "argument_type": "keyword",
         "expression_language_scope": "FLOWFILE_ATTRIBUTES"
+    },
+    {
+        "name": "chunk_size_mib",
+        "display_name": "Upload Chunk Size (MiB)",
+        "description": "The size of the chunks large files are uploaded in, rounded down to a multiple of 320 KiB and limited to 59.6875 MiB, as OneDrive rejects chunks of 60 MiB or more",
+        "type": "int",
+        "required": False,
+        "default_value": 32,
+        "argument_type": "keyword",
+        "expression_language_scope": "NONE"
+    },
+    {
+        "name": "concurrency",
+        "display_name": "Upload Concurrency",
+        "description": "The maximum number of files uploaded at the same time, lowered automatically while OneDrive throttles requests",
+        "type": "int",
+        "required": False,
+        "default_value": 8,
+        "argument_type": "keyword",
+        "expression_language_scope": "NONE"
+    },
+    {
+        "name": "skip_unchanged_files",
+        "display_name": "Skip Unchanged Files",
+        "description": "Whether to skip uploading files that already exist in OneDrive with the same size and content",
+        "type": "bool",
+        "required": False,
+        "default_value": False,
+        "argument_type": "keyword",
+        "expression_language_scope": "NONE"
     }
 ]
 
@@ -1,23 +1,164 @@
 """ This program transforms a xml file to a json file. """
 
-import xmltodict
+from xml.parsers import expat
+from concurrent.futures import ProcessPoolExecutor
 import json
 import argparse
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from msgspec import json as msgspec_json
+except ImportError:
+    msgspec_json = None
+
+# The JSON layout follows xmltodict: attributes are prefixed with "@", text next to attributes or child elements
+# is stored as "#text", repeated child elements are grouped into lists and empty elements become null
+ATTRIBUTE_PREFIX = "@"
+TEXT_KEY = "#text"
+
+# The JSON document is written in many small fragments, which are collected in a large buffer
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+
+def encode_json(value):
+    """Encodes a string or None as JSON, using orjson or msgspec if one of them is available"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    if msgspec_json is not None:
+        return msgspec_json.encode(value)
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+class XMLJSONBuilder:
+    """Converts expat parser events to JSON fragments.
+
+    Every element is encoded as soon as it is closed, so only the encoded children of the elements on the path to the
+    current one are kept in memory instead of the whole document as Python objects.
+    Repeated child elements may be far apart, so a parent is only encoded once all of its children are known.
+    """
+
+    def __init__(self):
+        self.stack = []
+        self.attributes = None
+        self.children = None
+        self.data = []
+        self.keys = {}
+        # The JSON document, as fragments to be written one after another
+        self.parts = None
+
+    def encode_key(self, name):
+        key = self.keys.get(name)
+        if key is None:
+            key = self.keys[name] = encode_json(name) + b":"
+        return key
+
+    def start_element(self, name, attributes):
+        self.stack.append((self.attributes, self.children, self.data))
+        # Ordered attributes arrive as a flat list of alternating names and values
+        self.attributes = attributes
+        self.children = None
+        self.data = []
+
+    def end_element(self, name):
+        text = "".join(self.data).strip() or None
+        attributes = self.attributes
+        children = self.children
+
+        if not attributes and children is None:
+            parts = [encode_json(text)]
+        else:
+            parts = [b"{"]
+            for index in range(0, len(attributes), 2):
+                if index:
+                    parts.append(b",")
+                parts.append(self.encode_key(ATTRIBUTE_PREFIX + attributes[index]))
+                parts.append(encode_json(attributes[index + 1]))
+            if children is not None:
+                for child_name, fragments in children.items():
+                    if len(parts) > 1:
+                        parts.append(b",")
+                    parts.append(self.encode_key(child_name))
+                    if len(fragments) == 1:
+                        parts.append(fragments[0])
+                    else:
+                        parts.append(b"[")
+                        parts.append(b",".join(fragments))
+                        parts.append(b"]")
+            if text:
+                if len(parts) > 1:
+                    parts.append(b",")
+                parts.append(self.encode_key(TEXT_KEY))
+                parts.append(encode_json(text))
+            parts.append(b"}")
+
+        self.attributes, self.children, self.data = self.stack.pop()
+        if not self.stack:
+            # The root element, its fragments are written as they are instead of joining them once more
+            self.parts = [b"{", self.encode_key(name)] + parts + [b"}"]
+            return
+        if self.children is None:
+            self.children = {}
+        fragments = self.children.get(name)
+        if fragments is None:
+            self.children[name] = [b"".join(parts)]
+        else:
+            fragments.append(b"".join(parts))
+
+    def characters(self, data):
+        self.data.append(data)
+
+
+def forbid_entities(*_args):
+    # Entity declarations allow entity expansion attacks and are rejected like xmltodict does
+    raise ValueError("entities are disabled")
+
+
+def parse_xml(file):
+    """Parses a XML file to a list of JSON fragments that form the converted document"""
+    builder = XMLJSONBuilder()
+    parser = expat.ParserCreate()
+    parser.ordered_attributes = True
+    parser.buffer_text = True
+    parser.StartElementHandler = builder.start_element
+    parser.EndElementHandler = builder.end_element
+    parser.CharacterDataHandler = builder.characters
+    parser.EntityDeclHandler = forbid_entities
+    # expat reads the file incrementally, so it is never held in memory as a whole
+    parser.ParseFile(file)
+    return builder.parts
+
 
 def convert_xml_to_json(input_filepath, output_filepath):
-    with open(input_filepath, "r") as file:
-        xml_data_string = file.read().replace("\n", "")
+    with open(input_filepath, "rb") as file:
+        json_parts = parse_xml(file)
+
+    with open(output_filepath, "wb", buffering=OUTPUT_BUFFER_SIZE) as out_file:
+        out_file.writelines(json_parts)
 
-    python_dict = xmltodict.parse(xml_data_string)
 
-    with open(output_filepath, "w") as out_file:
-        json.dump(python_dict, out_file)
+def convert_xml_files_to_json(input_filepaths, output_filepaths, max_workers=None):
+    """Converts several XML files to JSON files, in parallel processes if there is more than one"""
+    if len(input_filepaths) != len(output_filepaths):
+        raise ValueError("Every input file needs an output file")
+    if len(input_filepaths) == 1:
+        convert_xml_to_json(input_filepaths[0], output_filepaths[0])
+        return
+    # Each conversion is bound by the interpreter, processes use all cores where threads would share one
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(convert_xml_to_json, input_filepaths, output_filepaths, chunksize=4))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("input_filepath")
-    parser.add_argument("output_filepath")
+    parser.add_argument("filepaths", nargs="+", metavar="input_filepath output_filepath",
+                        help="One or more pairs of input and output file paths")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes converting files in parallel (default: number of CPUs)")
     args = parser.parse_args()
-    convert_xml_to_json(args.input_filepath, args.output_filepath)
\ No newline at end of file
+    if len(args.filepaths) % 2:
+        parser.error("file paths must be given as pairs of input and output file paths")
+    convert_xml_files_to_json(args.filepaths[0::2], args.filepaths[1::2], args.workers)